@@ -1,44 +1,86 @@
 # SPDX-License-Identifier: Apache-2.0
 # Copyright 2023 The HuggingFace Authors.
 
-from collections.abc import Callable
-from functools import partial
-from typing import Any, Optional
+import os
+from typing import Optional
 
 import anyio
 from datasets import Features
 from libcommon.dtos import Row
 from libcommon.storage_client import StorageClient
-from libcommon.viewer_utils.features import get_cell_value
-from tqdm.contrib.concurrent import thread_map
+from libcommon.viewer_utils.features import (
+    CellKind,
+    CellPlan,
+    cache_per_features,
+    compile_features_plan,
+    transform_cell,
+)
+
+# maximum number of rows of a call to transform_rows transformed at the same time, in worker threads, when the
+# features contain media files (same as the number of threads of the thread_map used before)
+MAX_CONCURRENT_ROWS_WITH_MEDIA = min(32, (os.cpu_count() or 1) + 4)
+# the media files that are uploaded (and audio files converted) in worker threads (the videos are only referenced)
+THREADED_CELL_KINDS = frozenset((CellKind.IMAGE, CellKind.AUDIO, CellKind.PDF))
+
+
+@cache_per_features
+def _get_columns_to_transform(features: Features) -> list[tuple[str, CellPlan]]:
+    # the other columns are returned as is by transform_cell, no need to call it
+    return [
+        (featureName, plan)
+        for (featureName, plan) in compile_features_plan(features).items()
+        if plan.kind is not CellKind.PASSTHROUGH
+    ]
+
+
+def _plan_needs_threads(plan: CellPlan) -> bool:
+    if plan.kind is CellKind.LIST:
+        return _plan_needs_threads(plan.payload[0])
+    if plan.kind is CellKind.DICT:
+        return any(_plan_needs_threads(subPlan) for subPlan in plan.payload.values())
+    return plan.kind in THREADED_CELL_KINDS
+
+
+@cache_per_features
+def _features_need_threads(features: Features) -> bool:
+    # computed from the plans of the columns, instead of walking the features again
+    return any(_plan_needs_threads(plan) for (_, plan) in _get_columns_to_transform(features))
 
 
 def _transform_row(
-    row_idx_and_row: tuple[int, Row],
+    row_idx: int,
+    row: Row,
     dataset: str,
     revision: str,
     config: str,
     split: str,
     features: Features,
     storage_client: StorageClient,
-    offset: int,
     row_idx_column: Optional[str],
 ) -> Row:
-    row_idx, row = row_idx_and_row
-    transformed_row = {
-        featureName: get_cell_value(
-            dataset=dataset,
-            revision=revision,
-            config=config,
-            split=split,
-            row_idx=offset + row_idx if row_idx_column is None else row[row_idx_column],
-            cell=row[featureName] if featureName in row else None,
-            featureName=featureName,
-            fieldType=fieldType,
-            storage_client=storage_client,
-        )
-        for (featureName, fieldType) in features.items()
-    }
+    # row_idx is the index of the row in the split (the offset is already added)
+    cell_row_idx = row_idx if row_idx_column is None else row[row_idx_column]
+    # copy the cells in the features order, then replace the ones that need to be transformed (e.g. images)
+    transformed_row = {featureName: row.get(featureName) for featureName in features}
+    for featureName, plan in _get_columns_to_transform(features):
+        cell = transformed_row[featureName]
+        # None (or missing) cells are returned as None by transform_cell, no need to call it
+        if cell is not None:
+            transformed_row[featureName] = transform_cell(
+                dataset=dataset,
+                revision=revision,
+                config=config,
+                split=split,
+                row_idx=cell_row_idx,
+                cell=cell,
+                featureName=featureName,
+                plan=plan,
+                storage_client=storage_client,
+            )
+            # release the original cell (e.g. image bytes or decoded image) as soon as it has been transformed,
+            # instead of keeping it in memory until the whole batch of rows is transformed
+            # (the cell is not None, so the column is in the row)
+            row[featureName] = None
     if row_idx_column and row_idx_column not in transformed_row:
         transformed_row |= {row_idx_column: row[row_idx_column]}
     return transformed_row
@@ -55,27 +97,74 @@ async def transform_rows(
     offset: int,
     row_idx_column: Optional[str],
 ) -> list[Row]:
-    fn = partial(
-        _transform_row,
-        dataset=dataset,
-        revision=revision,
-        config=config,
-        split=split,
-        features=features,
-        storage_client=storage_client,
-        offset=offset,
-        row_idx_column=row_idx_column,
-    )
-    if "Audio(" in str(features) or "Image(" in str(features) or "Pdf(" in str(features):
-        # Use multithreading to parallelize image/audio files uploads.
+    """Transforms the rows, so that they can be returned in a response (e.g. images are saved as assets).
+
+    Note that the input rows are modified: the cells that are transformed (e.g. images, audio files) are set to None
+    to release memory as soon as possible. The input rows must not be reused after the call.
+
+    Args:
+        dataset (`str`): the dataset name
+        revision (`str`): the dataset revision
+        config (`str`): the config name
+        split (`str`): the split name
+        rows (`list[Row]`): the rows to transform. Their transformed cells are set to None.
+        features (`Features`): the features of the rows
+        storage_client (`StorageClient`): the storage client used to save the assets
+        offset (`int`): the index of the first row, used to compute the row indexes
+        row_idx_column (`str`, *optional*): the column that contains the row indexes, if any
+
+    Returns:
+        `list[Row]`: the transformed rows, in the same order as the input rows
+    """
+    # a closure rather than a functools.partial with keyword arguments, which would copy them in a new dict for
+    # every row
+    row_idxs = range(offset, offset + len(rows))
+
+    def _transform(row_idx: int, row: Row) -> Row:
+        return _transform_row(
+            row_idx=row_idx,
+            row=row,
+            dataset=dataset,
+            revision=revision,
+            config=config,
+            split=split,
+            features=features,
+            storage_client=storage_client,
+            row_idx_column=row_idx_column,
+        )
+
+    if _features_need_threads(features):
+        # Transform the rows concurrently, one worker thread per row, to parallelize image/audio files uploads.
         # Also multithreading is ok to convert audio data
         # (we use pydub which might spawn one ffmpeg process per conversion, which releases the GIL)
-        desc = f"_transform_row for {dataset}"
-        _thread_map = partial(thread_map, desc=desc, total=len(rows))
-        return await anyio.to_thread.run_sync(_thread_map, fn, enumerate(rows))
+        transformed_rows: dict[int, Row] = {}
+        errors: list[Exception] = []
+        # one limiter per call, as the thread pool of thread_map before: the concurrent requests don't share it,
+        # and it doesn't use the tokens of the default anyio limiter (used by the other calls to run_sync)
+        limiter = anyio.CapacityLimiter(MAX_CONCURRENT_ROWS_WITH_MEDIA)
+
+        async with anyio.create_task_group() as task_group:
+
+            async def _transform_row_in_thread(row_idx: int, row: Row) -> None:
+                try:
+                    transformed_rows[row_idx] = await anyio.to_thread.run_sync(
+                        _transform, row_idx, row, limiter=limiter
+                    )
+                except Exception as err:
+                    # the task group would wrap the error in an ExceptionGroup: keep it, and cancel the other rows
+                    errors.append(err)
+                    task_group.cancel_scope.cancel()
+
+            for row_idx, row in zip(row_idxs, rows):
+                task_group.start_soon(_transform_row_in_thread, row_idx, row)
+        if errors:
+            # raise the first error that occurred (not necessarily the error of the failing row with the lowest index,
+            # since the rows are transformed concurrently)
+            raise errors[0]
+        return [transformed_rows[row_idx] for row_idx in row_idxs]
     else:
 
-        def _map(func: Callable[[Any], Any], *iterables: Any) -> list[Row]:
-            return list(map(func, *iterables))
+        def _transform_all() -> list[Row]:
+            return [_transform(row_idx, row) for row_idx, row in zip(row_idxs, rows)]
 
-        return await anyio.to_thread.run_sync(_map, fn, enumerate(rows))
+        return await anyio.to_thread.run_sync(_transform_all)
@@ -0,0 +1,109 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright 2023 The HuggingFace Authors.
+
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from datasets import Features, Image, Value
+from libcommon.dtos import Row
+from libcommon.storage_client import StorageClient
+from libcommon.url_preparator import URLPreparator
+from PIL import Image as PILImage
+
+from libapi.rows_utils import transform_rows
+
+pytestmark = pytest.mark.anyio
+
+CACHED_ASSETS_FOLDER = "cached-assets"
+NUM_ROWS = 40
+
+
+@pytest.fixture
+def storage_client(tmp_path: Path, hf_endpoint: str) -> StorageClient:
+    return StorageClient(
+        protocol="file",
+        storage_root=str(tmp_path / CACHED_ASSETS_FOLDER),
+        base_url="http://localhost/cached-assets",
+        url_preparator=URLPreparator(
+            url_signer=None, hf_endpoint=hf_endpoint, assets_base_url="http://localhost/cached-assets"
+        ),
+    )
+
+
+def get_image_bytes(width: int) -> bytes:
+    buffer = BytesIO()
+    PILImage.new("RGB", (width, 1)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+async def test_transform_rows_with_media_keeps_order(storage_client: StorageClient) -> None:
+    # more rows than MAX_CONCURRENT_ROWS_WITH_MEDIA, each one with a different image width
+    features = Features({"text": Value("string"), "image": Image()})
+    rows = [
+        {"text": f"row {idx}", "image": {"bytes": get_image_bytes(width=idx + 1), "path": None}}
+        for idx in range(NUM_ROWS)
+    ]
+    transformed_rows = await transform_rows(
+        dataset="ds",
+        revision="revision",
+        config="default",
+        split="train",
+        rows=rows,
+        features=features,
+        storage_client=storage_client,
+        offset=10,
+        row_idx_column=None,
+    )
+    assert len(transformed_rows) == NUM_ROWS
+    for idx, transformed_row in enumerate(transformed_rows):
+        assert transformed_row["text"] == f"row {idx}"
+        assert transformed_row["image"]["width"] == idx + 1
+        assert f"/--/revision/--/default/train/{10 + idx}/image/" in transformed_row["image"]["src"]
+
+
+async def test_transform_rows_with_media_raises_error_of_failing_row(storage_client: StorageClient) -> None:
+    features = Features({"image": Image()})
+    rows: list[Row] = [{"image": {"bytes": get_image_bytes(width=1), "path": None}} for _ in range(NUM_ROWS)]
+    rows[NUM_ROWS // 2] = {"image": "not an image"}
+    # the error of the row is raised, not an ExceptionGroup
+    with pytest.raises(TypeError, match="Image cell must be"):
+        await transform_rows(
+            dataset="ds",
+            revision="revision",
+            config="default",
+            split="train",
+            rows=rows,
+            features=features,
+            storage_client=storage_client,
+            offset=0,
+            row_idx_column=None,
+        )
+
+
+async def test_transform_rows_releases_transformed_cells(storage_client: StorageClient) -> None:
+    features = Features({"text": Value("string"), "image": Image(), "images": [Image()]})
+    image_bytes = get_image_bytes(width=1)
+    image_cell = {"bytes": image_bytes, "path": None}
+    # the second row has a None cell and a missing cell
+    rows: list[Row] = [
+        {"text": "row", "image": dict(image_cell), "images": [dict(image_cell)]},
+        {"text": "row", "image": None},
+    ]
+    transformed_rows = await transform_rows(
+        dataset="ds",
+        revision="revision",
+        config="default",
+        split="train",
+        rows=rows,
+        features=features,
+        storage_client=storage_client,
+        offset=0,
+        row_idx_column=None,
+    )
+    assert transformed_rows[0]["text"] == "row"
+    assert transformed_rows[0]["image"]["width"] == 1
+    assert transformed_rows[0]["images"][0]["width"] == 1
+    assert transformed_rows[1] == {"text": "row", "image": None, "images": None}
+    # the transformed cells of the input rows are set to None, the other cells are untouched
+    assert rows == [{"text": "row", "image": None, "images": None}, {"text": "row", "image": None}]
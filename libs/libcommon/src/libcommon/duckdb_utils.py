@@ -5,7 +5,15 @@ from typing import Any, Literal, Optional
 
 import duckdb
 import polars as pl
-from datasets.features.features import Features, FeatureType, Translation, TranslationVariableLanguages, Value, _visit
+from datasets.features.features import (
+    Features,
+    FeatureType,
+    LargeList,
+    List,
+    Translation,
+    TranslationVariableLanguages,
+    Value,
+)
 from huggingface_hub.repocard_data import DatasetCardData
 from tqdm.contrib.concurrent import thread_map
 
@@ -79,22 +87,23 @@ STEMMER_MAPPING = {
 LengthDtype = Literal["string", "list"]
 
 
+def is_indexable(feature: FeatureType) -> bool:
+    # walk the (possibly nested) feature, and stop at the first subfeature that contains string data
+    if isinstance(feature, Value):
+        return feature.dtype in STRING_DTYPES
+    elif isinstance(feature, (Translation, TranslationVariableLanguages)):
+        return True
+    elif isinstance(feature, dict):
+        return any(is_indexable(subfeature) for subfeature in feature.values())
+    elif isinstance(feature, (list, tuple)):
+        return is_indexable(feature[0])
+    elif isinstance(feature, (List, LargeList)):
+        return is_indexable(feature.feature)
+    return False
+
+
 def get_indexable_columns(features: Features) -> list[str]:
-    indexable_columns: list[str] = []
-    for column, feature in features.items():
-        indexable = False
-
-        def check_indexable(feature: FeatureType) -> None:
-            nonlocal indexable
-            if isinstance(feature, Value) and feature.dtype in STRING_DTYPES:
-                indexable = True
-            elif isinstance(feature, (Translation, TranslationVariableLanguages)):
-                indexable = True
-
-        _visit(feature, check_indexable)
-        if indexable:
-            indexable_columns.append(column)
-    return indexable_columns
+    return [column for column, feature in features.items() if is_indexable(feature)]
 
 
 def get_monolingual_stemmer(card_data: Optional[DatasetCardData]) -> str:
@@ -1,11 +1,15 @@
 # SPDX-License-Identifier: Apache-2.0
 # Copyright 2022 The HuggingFace Authors.
 
-import json
+import functools
 import logging
 import os
+import weakref
+from collections.abc import Callable
+from enum import IntEnum
 from io import BytesIO
-from typing import Any, Optional, Union
+from json.encoder import encode_basestring_ascii
+from typing import Any, NamedTuple, Optional, TypeVar, Union, cast
 from zlib import adler32
 
 import datasets.config
@@ -41,13 +45,73 @@ from libcommon.viewer_utils.asset import (
     create_video_file,
 )
 
-AUDIO_FILE_MAGIC_NUMBERS: dict[str, Any] = {
-    ".wav": [(b"\x52\x49\x46\x46", 0), (b"\x57\x41\x56\x45", 8)],  # AND: (magic_number, start)
-    ".mp3": (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2", b"\x49\x44\x33"),  # OR
-}
+# WAV: "RIFF" at offset 0 and "WAVE" at offset 8
+WAV_MAGIC_NUMBERS = (b"\x52\x49\x46\x46", b"\x57\x41\x56\x45")
+# MP3: a frame sync in the first 2 bytes, or an "ID3" tag in the first 3 bytes
+MP3_FRAME_SYNC_MAGIC_NUMBERS = frozenset((b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"))
+MP3_ID3_MAGIC_NUMBER = b"\x49\x44\x33"
+
+# JPEG: a SOI marker followed by the first marker; PNG: the 8-byte signature; GIF: "GIF87a" or "GIF89a"; BMP: "BM";
+# TIFF: the little-endian or big-endian byte order mark followed by 42
+JPEG_MAGIC_NUMBER = b"\xff\xd8\xff"
+PNG_MAGIC_NUMBER = b"\x89PNG\r\n\x1a\n"
+GIF_MAGIC_NUMBERS = frozenset((b"GIF87a", b"GIF89a"))
+BMP_MAGIC_NUMBER = b"BM"
+TIFF_MAGIC_NUMBERS = frozenset((b"II*\x00", b"MM\x00*"))
+
+# (file extension, format) to write the images, by order of preference
+IMAGE_FORMATS = [(".jpg", "JPEG"), (".png", "PNG")]
+PNG_IMAGE_FORMATS = [(".png", "PNG")]
+# the image modes that can be written as JPEG (see PIL.JpegImagePlugin), for example the modes P and RGBA cannot
+JPEG_IMAGE_MODES = frozenset(("1", "L", "RGB", "RGBX", "CMYK", "YCbCr"))
+
+# feature types whose cells are returned as is by transform_cell
+PASSTHROUGH_FEATURE_TYPES = (
+    Value,
+    ClassLabel,
+    Array2D,
+    Array3D,
+    Array4D,
+    Array5D,
+    Translation,
+    TranslationVariableLanguages,
+)
 
 logging.getLogger("pdfminer").setLevel(logging.ERROR)
 
+T = TypeVar("T")
+
+
+def cache_per_features(func: Callable[[Features], T]) -> Callable[[Features], T]:
+    """
+    Memoize a function of a Features object, for as long as the object is alive.
+
+    Features objects are not hashable, so the results are keyed by the object identity, and the entry is removed when
+    the object is garbage collected (so that its id cannot be reused by another object). The Features object must not
+    be mutated after the first call. Objects that cannot be weak-referenced (e.g. plain dicts) are not cached.
+
+    Args:
+        func (`Callable[[Features], T]`): the function to memoize.
+    Returns:
+        `Callable[[Features], T]`: the memoized function.
+    """
+    cache: dict[int, T] = {}
+
+    @functools.wraps(func)
+    def wrapper(features: Features) -> T:
+        key = id(features)
+        if key in cache:
+            return cache[key]
+        result = func(features)
+        try:
+            weakref.finalize(features, cache.pop, key, None)
+        except TypeError:
+            return result
+        cache[key] = result
+        return result
+
+    return wrapper
+
 
 def append_hash_suffix(string: str, json_path: Optional[list[Union[str, int]]] = None) -> str:
     """
@@ -63,7 +127,35 @@ def append_hash_suffix(string: str, json_path: Optional[list[Union[str, int]]] =
     Returns:
         `str`: the string suffixed with the hash of the json path
     """
-    return f"{string}-{hex(adler32(json.dumps(json_path).encode()))[2:]}" if json_path else string
+    return f"{string}-{_hash_json_path(tuple(json_path))}" if json_path else string
+
+
+# The same json paths are hashed again for every row (and for sibling cells), so we memoize the hashes.
+@functools.lru_cache(maxsize=10_000)
+def _hash_json_path(json_path: tuple[Union[str, int], ...]) -> str:
+    # Same bytes as json.dumps(json_path).encode() (the hashes are part of the assets filenames, they must not
+    # change), but without going through the generic JSON encoder.
+    serialized_json_path = ", ".join(
+        [encode_basestring_ascii(key) if isinstance(key, str) else str(key) for key in json_path]
+    )
+    return format(adler32(f"[{serialized_json_path}]".encode()), "x")
+
+
+def infer_image_formats(image_bytes: bytes) -> Optional[tuple[str, ...]]:
+    # the PIL format of the most common image files, to only try its plugin instead of probing all of them
+    # (None means that all the formats are tried)
+    # the other formats (e.g. WEBP) rely on optional libraries, and are left to PIL's detection
+    if image_bytes[0:3] == JPEG_MAGIC_NUMBER:
+        return ("JPEG",)
+    if image_bytes[0:8] == PNG_MAGIC_NUMBER:
+        return ("PNG",)
+    if image_bytes[0:6] in GIF_MAGIC_NUMBERS:
+        return ("GIF",)
+    if image_bytes[0:4] in TIFF_MAGIC_NUMBERS:
+        return ("TIFF",)
+    if image_bytes[0:2] == BMP_MAGIC_NUMBER:
+        return ("BMP",)
+    return None
 
 
 def image(
@@ -80,9 +172,9 @@ def image(
     if value is None:
         return None
     if isinstance(value, dict) and value.get("bytes"):
-        value = PILImage.open(BytesIO(value["bytes"]))
+        value = PILImage.open(BytesIO(value["bytes"]), formats=infer_image_formats(value["bytes"]))
     elif isinstance(value, bytes):
-        value = PILImage.open(BytesIO(value))
+        value = PILImage.open(BytesIO(value), formats=infer_image_formats(value))
     elif (
         isinstance(value, dict)
         and "path" in value
@@ -96,7 +188,8 @@ def image(
             f"but got {str(value)[:300]}{'...' if len(str(value)) > 300 else ''}"
         )
     # attempt to generate one of the supported formats; if unsuccessful, throw an error
-    for ext, format in [(".jpg", "JPEG"), (".png", "PNG")]:
+    # (JPEG is not even attempted for the modes it does not support, to avoid raising and catching an error)
+    for ext, format in IMAGE_FORMATS if value.mode in JPEG_IMAGE_MODES else PNG_IMAGE_FORMATS:
         try:
             return create_image_file(
                 dataset=dataset,
@@ -118,6 +211,27 @@ def image(
     raise ValueError("Image cannot be written as JPEG or PNG")
 
 
+@functools.cache
+def _get_audio_decoder_types() -> tuple[Any, ...]:
+    # Imported once, on first use, instead of in every call to the audio functions, and not at module load because
+    # it imports torch. Without torchcodec (e.g. on linux aarch64), the cells can't be AudioDecoder objects.
+    if not datasets.config.TORCHCODEC_AVAILABLE:
+        return ()
+    from datasets.features._torchcodec import AudioDecoder
+
+    return (AudioDecoder,)
+
+
+@functools.cache
+def _get_video_reader_types() -> tuple[Any, ...]:
+    # same as _get_audio_decoder_types, for the torchvision VideoReader objects
+    if not datasets.config.TORCHVISION_AVAILABLE:
+        return ()
+    from torchvision.io import VideoReader  # type: ignore
+
+    return (VideoReader,)
+
+
 def audio(
     dataset: str,
     revision: str,
@@ -129,11 +243,9 @@ def audio(
     storage_client: StorageClient,
     json_path: Optional[list[Union[str, int]]] = None,
 ) -> Any:
-    from datasets.features._torchcodec import AudioDecoder
-
     if value is None:
         return None
-    if not isinstance(value, (dict, AudioDecoder)):
+    if not isinstance(value, dict) and not isinstance(value, _get_audio_decoder_types()):
         raise TypeError(
             "Audio cell must be an encoded dict of an audio sample or a torchcodec AudioDecoder, "
             f"but got {str(value)[:300]}{'...' if len(str(value)) > 300 else ''}"
@@ -162,8 +274,6 @@ def audio(
 
 
 def get_audio_file_bytes(value: Any) -> bytes:
-    from datasets.features._torchcodec import AudioDecoder
-
     if isinstance(value, dict) and "bytes" in value and isinstance(value["bytes"], bytes):
         audio_file_bytes = value["bytes"]
     elif (
@@ -174,7 +284,7 @@ def get_audio_file_bytes(value: Any) -> bytes:
     ):
         with open(value["path"], "rb") as f:
             audio_file_bytes = f.read()
-    elif isinstance(value, AudioDecoder):
+    elif isinstance(value, _get_audio_decoder_types()):
         if (
             hasattr(value, "_hf_encoded")
             and isinstance(value._hf_encoded, dict)
@@ -187,7 +297,7 @@ def get_audio_file_bytes(value: Any) -> bytes:
             _sampling_rate = value["sampling_rate"]
             if isinstance(_array, np.ndarray) and isinstance(_sampling_rate, int):
                 buffer = BytesIO()
-                soundfile.write(buffer, _array, _sampling_rate, format="wav")
+                soundfile.write(buffer, to_pcm_16(_array), _sampling_rate, format="wav", subtype="PCM_16")
                 audio_file_bytes = buffer.getvalue()
     else:
         raise ValueError(
@@ -197,28 +307,67 @@ def get_audio_file_bytes(value: Any) -> bytes:
     return audio_file_bytes
 
 
-def get_audio_file_extension(value: Any) -> Optional[str]:
-    from datasets.features._torchcodec import AudioDecoder
+def to_pcm_16(array: np.ndarray) -> np.ndarray:
+    """
+    Convert float audio samples to 16-bit PCM samples, as libsndfile does when writing them to a 16-bit PCM file,
+    but vectorized with numpy (much faster than letting libsndfile convert them sample by sample).
 
+    Args:
+        array (`np.ndarray`): the audio samples. Integer samples are returned unchanged.
+    Returns:
+        `np.ndarray`: the 16-bit PCM samples.
+    """
+    if array.dtype.kind != "f":
+        return array
+    scaled = array * 32768
+    np.floor(scaled, out=scaled)
+    # as libsndfile, NaN samples are written as -32768 (and the infinite samples are clipped)
+    np.nan_to_num(scaled, copy=False, nan=-32768.0)
+    np.clip(scaled, -32768, 32767, out=scaled)
+    return scaled.astype(np.int16)
+
+
+def get_path_extension(path: str) -> str:
+    """
+    Get the extension of a file path or URL, in one pass over the string.
+
+    Same result as os.path.splitext(path.split("::")[0])[1], where .split("::")[0] is for chained URLs like
+    zip://audio.wav::https://foo.bar/data.zip.
+
+    Args:
+        path (`str`): the file path or URL.
+    Returns:
+        `str`: the extension, with the leading dot, or "" if there is no extension.
+    """
+    end = path.find("::")
+    if end < 0:
+        end = len(path)
+    dot_index = path.rfind(".", 0, end)
+    sep_index = path.rfind("/", 0, end)
+    # as in os.path.splitext, the leading dots of a file name do not start an extension (e.g. ".bashrc")
+    if dot_index > sep_index and path[sep_index + 1 : dot_index].lstrip("."):  # noqa: E203
+        return path[dot_index:end]
+    return ""
+
+
+def get_audio_file_extension(value: Any) -> Optional[str]:
     if isinstance(value, dict) and "path" in value:
         if isinstance(value["path"], str):
-            # .split("::")[0] for chained URLs like zip://audio.wav::https://foo.bar/data.zip
             # It might be "" for audio files downloaded from the Hub: make it None
-            audio_file_extension = os.path.splitext(value["path"].split("::")[0])[1] or None
+            audio_file_extension = get_path_extension(value["path"]) or None
         else:
             audio_file_extension = None
     elif isinstance(value, dict) and "bytes" in value and isinstance(value["bytes"], bytes):
         audio_file_extension = None
-    elif isinstance(value, AudioDecoder):
+    elif isinstance(value, _get_audio_decoder_types()):
         if (
             hasattr(value, "_hf_encoded")
             and isinstance(value._hf_encoded, dict)
             and "path" in value._hf_encoded
             and isinstance(value._hf_encoded["path"], str)
         ):
-            # .split("::")[0] for chained URLs like zip://audio.wav::https://foo.bar/data.zip
             # It might be "" for audio files downloaded from the Hub: make it None
-            audio_file_extension = os.path.splitext(value._hf_encoded["path"].split("::")[0])[1] or None
+            audio_file_extension = get_path_extension(value._hf_encoded["path"]) or None
         else:
             audio_file_extension = None
     else:
@@ -229,13 +378,11 @@ def get_audio_file_extension(value: Any) -> Optional[str]:
 
 
 def infer_audio_file_extension(audio_file_bytes: bytes) -> Optional[str]:
-    for audio_file_extension, magic_numbers in AUDIO_FILE_MAGIC_NUMBERS.items():
-        if isinstance(magic_numbers, list):
-            if all(audio_file_bytes.startswith(magic_number, start) for magic_number, start in magic_numbers):
-                return audio_file_extension
-        else:
-            if audio_file_bytes.startswith(magic_numbers):
-                return audio_file_extension
+    # compare fixed slices of the header, instead of iterating over the magic numbers of every format
+    if audio_file_bytes[0:4] == WAV_MAGIC_NUMBERS[0] and audio_file_bytes[8:12] == WAV_MAGIC_NUMBERS[1]:
+        return ".wav"
+    if audio_file_bytes[0:2] in MP3_FRAME_SYNC_MAGIC_NUMBERS or audio_file_bytes[0:3] == MP3_ID3_MAGIC_NUMBER:
+        return ".mp3"
     return None
 
 
@@ -250,17 +397,10 @@ def video(
     storage_client: StorageClient,
     json_path: Optional[list[Union[str, int]]] = None,
 ) -> Any:
-    if datasets.config.TORCHVISION_AVAILABLE:
-        from torchvision.io import VideoReader  # type: ignore
-
-    else:
-        VideoReader = None
-
     if value is None:
         return None
     if (
-        VideoReader
-        and isinstance(value, VideoReader)
+        isinstance(value, _get_video_reader_types())
         and hasattr(value, "_hf_encoded")
         and isinstance(value._hf_encoded, dict)
     ):
@@ -294,8 +434,7 @@ def video(
 
 def get_video_file_extension(value: Any) -> str:
     if "path" in value and isinstance(value["path"], str):
-        # .split("::")[0] for chained URLs like zip://audio.wav::https://foo.bar/data.zip
-        video_file_extension = os.path.splitext(value["path"].split("::")[0])[1]
+        video_file_extension = get_path_extension(value["path"])
         if not video_file_extension:
             raise ValueError(
                 "A video sample should have a 'path' with a valid file name nd extension, but got"
@@ -351,6 +490,177 @@ def pdf(
     )
 
 
+class CellKind(IntEnum):
+    PASSTHROUGH = 0
+    IMAGE = 1
+    AUDIO = 2
+    VIDEO = 3
+    PDF = 4
+    LIST = 5
+    DICT = 6
+    INVALID = 7
+    # lists and dicts whose items are all passthrough: they are copied at once instead of walking their items
+    COPY_LIST = 8
+    COPY_DICT = 9
+
+
+class CellPlan(NamedTuple):
+    """
+    How to transform the cells of a (possibly nested) feature type. It is computed once per feature type, so that
+    the type dispatch is not repeated for every cell.
+
+    The payload depends on the kind:
+    - LIST: a tuple (plan of the items, expected length of the list or -1)
+    - COPY_LIST: the expected length of the list or -1
+    - DICT: a dict {key: plan of the values}
+    - COPY_DICT: a frozenset of the keys
+    - INVALID: the error message raised for non-None cells
+    - other kinds: None
+    """
+
+    kind: CellKind
+    payload: Any = None
+
+
+PASSTHROUGH_PLAN = CellPlan(kind=CellKind.PASSTHROUGH)
+MEDIA_TRANSFORMS: dict[CellKind, Callable[..., Any]] = {
+    CellKind.IMAGE: image,
+    CellKind.AUDIO: audio,
+    CellKind.VIDEO: video,
+    CellKind.PDF: pdf,
+}
+
+
+def _list_plan(subPlan: CellPlan, length: int) -> CellPlan:
+    if subPlan.kind is CellKind.PASSTHROUGH:
+        return CellPlan(kind=CellKind.COPY_LIST, payload=length)
+    return CellPlan(kind=CellKind.LIST, payload=(subPlan, length))
+
+
+def compile_cell_plan(fieldType: Any) -> CellPlan:
+    """
+    Compute the plan to transform the cells of a feature type.
+
+    Args:
+        fieldType (`Any`): the (possibly nested) feature type.
+    Returns:
+        `CellPlan`: the plan, to be passed to transform_cell.
+    """
+    if isinstance(fieldType, Image):
+        return CellPlan(kind=CellKind.IMAGE)
+    elif isinstance(fieldType, Audio):
+        return CellPlan(kind=CellKind.AUDIO)
+    elif isinstance(fieldType, Video):
+        return CellPlan(kind=CellKind.VIDEO)
+    elif isinstance(fieldType, Pdf):
+        return CellPlan(kind=CellKind.PDF)
+    elif isinstance(fieldType, list):
+        if len(fieldType) != 1:
+            return CellPlan(kind=CellKind.INVALID, payload="the feature type should be a 1-element list.")
+        return _list_plan(compile_cell_plan(fieldType[0]), -1)
+    elif isinstance(fieldType, LargeList):
+        return _list_plan(compile_cell_plan(fieldType.feature), -1)
+    elif isinstance(fieldType, List):
+        return _list_plan(compile_cell_plan(fieldType.feature), fieldType.length)
+    elif isinstance(fieldType, dict):
+        subPlans = {key: compile_cell_plan(subFieldType) for (key, subFieldType) in fieldType.items()}
+        if all(subPlan.kind is CellKind.PASSTHROUGH for subPlan in subPlans.values()):
+            return CellPlan(kind=CellKind.COPY_DICT, payload=frozenset(subPlans))
+        return CellPlan(kind=CellKind.DICT, payload=subPlans)
+    elif isinstance(fieldType, PASSTHROUGH_FEATURE_TYPES):
+        return PASSTHROUGH_PLAN
+    else:
+        return CellPlan(kind=CellKind.INVALID, payload="could not determine the type of the data cell.")
+
+
+@cache_per_features
+def compile_features_plan(features: Features) -> dict[str, CellPlan]:
+    return {featureName: compile_cell_plan(fieldType) for (featureName, fieldType) in features.items()}
+
+
+def transform_cell(
+    dataset: str,
+    revision: str,
+    config: str,
+    split: str,
+    row_idx: int,
+    cell: Any,
+    featureName: str,
+    plan: CellPlan,
+    storage_client: StorageClient,
+    json_path: Optional[list[Union[str, int]]] = None,
+) -> Any:
+    """
+    Transform a cell following its plan (see compile_cell_plan), e.g. store the images and audio files as assets.
+
+    The nested sub-cells are walked with an explicit stack instead of recursive calls. Each item of the stack is a
+    sub-cell, with its plan and depth, and the container (list or dict) and key where to write the result.
+
+    The json path of the current sub-cell is kept in a single list: as the sub-cells are walked depth-first, the
+    path of the parent of a sub-cell at a given depth is the beginning of the list, until that depth.
+    """
+    path: list[Union[str, int]] = list(json_path) if json_path else []
+    rootDepth = len(path)
+    root: list[Any] = [None]
+    stack: list[tuple[CellPlan, Any, int, Any, Union[str, int]]] = [(plan, cell, rootDepth, root, 0)]
+    while stack:
+        (kind, payload), cell, depth, container, key = stack.pop()
+        # always allow None values in the cells (the containers are initialized with None values)
+        if cell is None:
+            continue
+        if kind is CellKind.PASSTHROUGH:
+            container[key] = cell
+        elif kind is CellKind.COPY_LIST:
+            if not isinstance(cell, list):
+                raise TypeError("list cell must be a list.")
+            if payload >= 0 and len(cell) != payload:
+                raise TypeError("the cell length should be the same as the List length.")
+            container[key] = list(cell)
+        elif kind is CellKind.COPY_DICT:
+            if not isinstance(cell, dict):
+                raise TypeError("dict cell must be a dict.")
+            if not payload.issuperset(cell):
+                # same error as when looking up the plan of an unknown key in a DICT plan
+                raise KeyError(next(subKey for subKey in cell if subKey not in payload))
+            container[key] = dict(cell)
+        else:
+            # the json path is only needed by the media files, and the containers that can contain them
+            if depth > rootDepth:
+                del path[depth - 1 :]  # noqa: E203
+                path.append(key)
+            if kind is CellKind.LIST:
+                if not isinstance(cell, list):
+                    raise TypeError("list cell must be a list.")
+                subPlan, length = payload
+                if length >= 0 and len(cell) != length:
+                    raise TypeError("the cell length should be the same as the List length.")
+                container[key] = subList = [None] * len(cell)
+                # push in reverse order, so that the sub-cells are processed in order
+                for idx in reversed(range(len(cell))):
+                    stack.append((subPlan, cell[idx], depth + 1, subList, idx))
+            elif kind is CellKind.DICT:
+                if not isinstance(cell, dict):
+                    raise TypeError("dict cell must be a dict.")
+                container[key] = subDict = dict.fromkeys(cell)
+                for subKey, subCell in reversed(cell.items()):
+                    stack.append((payload[subKey], subCell, depth + 1, subDict, subKey))
+            elif kind is CellKind.INVALID:
+                raise TypeError(payload)
+            else:
+                container[key] = MEDIA_TRANSFORMS[kind](
+                    dataset=dataset,
+                    revision=revision,
+                    config=config,
+                    split=split,
+                    row_idx=row_idx,
+                    value=cell,
+                    featureName=featureName,
+                    storage_client=storage_client,
+                    json_path=path,
+                )
+    return root[0]
+
+
 def get_cell_value(
     dataset: str,
     revision: str,
@@ -363,152 +673,29 @@ def get_cell_value(
     storage_client: StorageClient,
     json_path: Optional[list[Union[str, int]]] = None,
 ) -> Any:
-    # always allow None values in the cells
-    if cell is None:
-        return cell
-    if isinstance(fieldType, Image):
-        return image(
-            dataset=dataset,
-            revision=revision,
-            config=config,
-            split=split,
-            row_idx=row_idx,
-            value=cell,
-            featureName=featureName,
-            storage_client=storage_client,
-            json_path=json_path,
-        )
-    elif isinstance(fieldType, Audio):
-        return audio(
-            dataset=dataset,
-            revision=revision,
-            config=config,
-            split=split,
-            row_idx=row_idx,
-            value=cell,
-            featureName=featureName,
-            storage_client=storage_client,
-            json_path=json_path,
-        )
-    elif isinstance(fieldType, Video):
-        return video(
-            dataset=dataset,
-            revision=revision,
-            config=config,
-            split=split,
-            row_idx=row_idx,
-            value=cell,
-            featureName=featureName,
-            storage_client=storage_client,
-            json_path=json_path,
-        )
-    elif isinstance(fieldType, Pdf):
-        return pdf(
-            dataset=dataset,
-            revision=revision,
-            config=config,
-            split=split,
-            row_idx=row_idx,
-            value=cell,
-            featureName=featureName,
-            storage_client=storage_client,
-            json_path=json_path,
-        )
-    elif isinstance(fieldType, list):
-        if not isinstance(cell, list):
-            raise TypeError("list cell must be a list.")
-        if len(fieldType) != 1:
-            raise TypeError("the feature type should be a 1-element list.")
-        subFieldType = fieldType[0]
-        return [
-            get_cell_value(
-                dataset=dataset,
-                revision=revision,
-                config=config,
-                split=split,
-                row_idx=row_idx,
-                cell=subCell,
-                featureName=featureName,
-                fieldType=subFieldType,
-                storage_client=storage_client,
-                json_path=json_path + [idx] if json_path else [idx],
-            )
-            for (idx, subCell) in enumerate(cell)
-        ]
-    elif isinstance(fieldType, LargeList):
-        if not isinstance(cell, list):
-            raise TypeError("list cell must be a list.")
-        subFieldType = fieldType.feature
-        return [
-            get_cell_value(
-                dataset=dataset,
-                revision=revision,
-                config=config,
-                split=split,
-                row_idx=row_idx,
-                cell=subCell,
-                featureName=featureName,
-                fieldType=subFieldType,
-                storage_client=storage_client,
-                json_path=json_path + [idx] if json_path else [idx],
-            )
-            for (idx, subCell) in enumerate(cell)
-        ]
-    elif isinstance(fieldType, List):
-        if not isinstance(cell, list):
-            raise TypeError("list cell must be a list.")
-        if fieldType.length >= 0 and len(cell) != fieldType.length:
-            raise TypeError("the cell length should be the same as the List length.")
-        return [
-            get_cell_value(
-                dataset=dataset,
-                revision=revision,
-                config=config,
-                split=split,
-                row_idx=row_idx,
-                cell=subCell,
-                featureName=featureName,
-                fieldType=fieldType.feature,
-                storage_client=storage_client,
-                json_path=json_path + [idx] if json_path else [idx],
-            )
-            for (idx, subCell) in enumerate(cell)
-        ]
+    """
+    Transform a cell given its feature type. Kept as a compatibility wrapper: the plan is compiled on every call, use
+    compile_cell_plan (or compile_features_plan) once and transform_cell to transform many cells.
+    """
+    return transform_cell(
+        dataset=dataset,
+        revision=revision,
+        config=config,
+        split=split,
+        row_idx=row_idx,
+        cell=cell,
+        featureName=featureName,
+        plan=compile_cell_plan(fieldType),
+        storage_client=storage_client,
+        json_path=json_path,
+    )
 
-    elif isinstance(fieldType, dict):
-        if not isinstance(cell, dict):
-            raise TypeError("dict cell must be a dict.")
-        return {
-            key: get_cell_value(
-                dataset=dataset,
-                revision=revision,
-                config=config,
-                split=split,
-                row_idx=row_idx,
-                cell=subCell,
-                featureName=featureName,
-                fieldType=fieldType[key],
-                storage_client=storage_client,
-                json_path=json_path + [key] if json_path else [key],
-            )
-            for (key, subCell) in cell.items()
-        }
-    elif isinstance(
-        fieldType,
-        (
-            Value,
-            ClassLabel,
-            Array2D,
-            Array3D,
-            Array4D,
-            Array5D,
-            Translation,
-            TranslationVariableLanguages,
-        ),
-    ):
-        return cell
-    else:
-        raise TypeError("could not determine the type of the data cell.")
+
+# features.to_dict() serializes the whole (possibly nested) features, it's computed once per Features object
+# note that the result is shared: it must not be mutated
+@cache_per_features
+def _get_features_dict(features: Features) -> dict[str, Any]:
+    return cast(dict[str, Any], features.to_dict())
 
 
 # in JSON, dicts do not carry any order, so we need to return a list
@@ -519,7 +706,18 @@ def get_cell_value(
 # > The terms "object" and "array" come from the conventions of JavaScript.
 # from https://stackoverflow.com/a/7214312/7351594 / https://www.rfc-editor.org/rfc/rfc7159.html
 def to_features_list(features: Features) -> list[FeatureItem]:
-    features_dict = features.to_dict()
+    """
+    Get the list of the features, with their index, name and serialized type.
+
+    The list is new on every call, but the "type" values are cached per Features object, and shared by all the
+    calls for the same Features: they must not be mutated (copy them before modifying them).
+
+    Args:
+        features (`Features`): the features.
+    Returns:
+        `list[FeatureItem]`: the list of the features.
+    """
+    features_dict = _get_features_dict(features)
     return [
         {
             "feature_idx": idx,
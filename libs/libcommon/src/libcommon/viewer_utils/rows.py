@@ -14,7 +14,7 @@ from libcommon.exceptions import (
 )
 from libcommon.storage_client import StorageClient
 from libcommon.utils import get_json_size
-from libcommon.viewer_utils.features import get_cell_value, to_features_list
+from libcommon.viewer_utils.features import compile_features_plan, to_features_list, transform_cell
 from libcommon.viewer_utils.truncate_rows import create_truncated_row_items
 
 URL_COLUMN_RATIO = 0.3
@@ -29,20 +29,21 @@ def transform_rows(
     features: Features,
     storage_client: StorageClient,
 ) -> list[Row]:
+    features_plan = compile_features_plan(features)
     return [
         {
-            featureName: get_cell_value(
+            featureName: transform_cell(
                 dataset=dataset,
                 revision=revision,
                 config=config,
                 split=split,
                 row_idx=row_idx,
-                cell=row[featureName] if featureName in row else None,
+                cell=row.get(featureName),
                 featureName=featureName,
-                fieldType=fieldType,
+                plan=plan,
                 storage_client=storage_client,
             )
-            for (featureName, fieldType) in features.items()
+            for (featureName, plan) in features_plan.items()
         }
         for row_idx, row in enumerate(rows)
     ]
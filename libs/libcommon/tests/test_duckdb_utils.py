@@ -0,0 +1,33 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright 2025 The HuggingFace Authors.
+
+from datasets import Audio, ClassLabel, Features, Image, LargeList, List, Translation, Value
+
+from libcommon.duckdb_utils import get_indexable_columns
+
+
+def test_get_indexable_columns() -> None:
+    features = Features(
+        {
+            "int": Value("int32"),
+            "string": Value("string"),
+            "large_string": Value("large_string"),
+            "label": ClassLabel(names=["a", "b"]),
+            "image": Image(),
+            "audio": Audio(),
+            "translation": Translation(languages=["en", "fr"]),
+            "list_of_ints": List(Value("int32")),
+            "list_of_strings": List(Value("string")),
+            "large_list_of_strings": LargeList(Value("string")),
+            "dict_without_strings": {"a": Value("int32"), "b": List(Value("float32"))},
+            "nested_dict_with_strings": {"a": Value("int32"), "b": List({"c": Value("string")})},
+        }
+    )
+    assert get_indexable_columns(features) == [
+        "string",
+        "large_string",
+        "translation",
+        "list_of_strings",
+        "large_list_of_strings",
+        "nested_dict_with_strings",
+    ]
@@ -3,23 +3,38 @@
 
 import os
 from collections.abc import Mapping
+from io import BytesIO
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional, Union
 from unittest.mock import patch
 
 import boto3
+import numpy as np
 import pytest
+import soundfile  # type: ignore
 from aiobotocore.response import StreamingBody
+from datasets import Features, Image, LargeList, List, Value
 from moto import mock_s3
+from PIL import Image as PILImage
 from urllib3._collections import HTTPHeaderDict
 
 from libcommon.config import S3Config
 from libcommon.storage_client import StorageClient
 from libcommon.url_preparator import URLPreparator
 from libcommon.viewer_utils.features import (
+    CellKind,
+    append_hash_suffix,
+    audio,
+    cache_per_features,
+    compile_cell_plan,
     get_cell_value,
+    get_path_extension,
+    image,
     infer_audio_file_extension,
+    infer_image_formats,
     to_features_list,
+    to_pcm_16,
+    transform_cell,
 )
 
 from ..constants import (
@@ -98,6 +113,9 @@ def test_to_features_list(
     assert first_feature["feature_idx"] == 0
     assert first_feature["name"] == DEFAULT_COLUMN_NAME
     assert first_feature["type"] == datasets_fixture.expected_feature_type
+    # the serialized features are cached per Features object, but a new list is returned every time
+    assert to_features_list(dataset.features) == value
+    assert to_features_list(dataset.features) is not value
 
 
 # specific test created for https://github.com/huggingface/dataset-viewer/issues/2045
@@ -180,3 +198,298 @@ def test_infer_audio_file_extension(
     audio_file_bytes = (shared_datadir / audio_file_name).read_bytes()
     audio_file_extension = infer_audio_file_extension(audio_file_bytes)
     assert audio_file_extension == expected_audio_file_extension
+
+
+def test_audio_encoded_dict(storage_client_with_url_preparator: StorageClient, shared_datadir: Path) -> None:
+    # the encoded audio files don't need torchcodec
+    value = audio(
+        dataset="dataset",
+        revision=DEFAULT_REVISION,
+        config=DEFAULT_CONFIG,
+        split=DEFAULT_SPLIT,
+        row_idx=DEFAULT_ROW_IDX,
+        value={"bytes": (shared_datadir / "test_audio_44100.wav").read_bytes(), "path": None},
+        featureName=DEFAULT_COLUMN_NAME,
+        storage_client=storage_client_with_url_preparator,
+    )
+    assert len(value) == 1
+    assert value[0]["src"].endswith("/audio.wav")
+    assert value[0]["type"] == "audio/wav"
+
+
+@pytest.mark.parametrize(
+    "audio_file_bytes,expected_audio_file_extension",
+    [
+        (b"RIFF\x24\x08\x00\x00WAVEfmt ", ".wav"),
+        (b"RIFF\x24\x08\x00\x00AVI LIST", None),
+        (b"\xff\xfb\x90\x64", ".mp3"),
+        (b"\xff\xf3\x90\x64", ".mp3"),
+        (b"\xff\xf2\x90\x64", ".mp3"),
+        (b"ID3\x04\x00", ".mp3"),
+        (b"OggS\x00\x02", None),
+        (b"RIFF", None),
+        (b"", None),
+    ],
+)
+def test_infer_audio_file_extension_from_header(
+    audio_file_bytes: bytes, expected_audio_file_extension: Optional[str]
+) -> None:
+    assert infer_audio_file_extension(audio_file_bytes) == expected_audio_file_extension
+
+
+def test_cache_per_features() -> None:
+    calls: list[int] = []
+
+    @cache_per_features
+    def get_num_columns(features: Features) -> int:
+        calls.append(id(features))
+        return len(features)
+
+    features = Features({"a": Value("int32"), "b": Value("string")})
+    assert get_num_columns(features) == 2
+    assert get_num_columns(features) == 2
+    assert len(calls) == 1
+    assert get_num_columns(Features({"a": Value("int32")})) == 1
+    assert len(calls) == 2
+    # plain dicts cannot be weak-referenced, they are not cached
+    assert get_num_columns({"a": Value("int32")}) == 1
+    assert get_num_columns({"a": Value("int32")}) == 1
+    assert len(calls) == 4
+
+
+@pytest.mark.parametrize(
+    "json_path,expected",
+    [
+        (None, "image"),
+        ([], "image"),
+        ([0], "image-1d100e9"),
+        ([1], "image-1d300ea"),
+        ([0, "a"], "image-82401da"),
+        (["key", 12, "é"], "image-3bea0554"),
+    ],
+)
+def test_append_hash_suffix(json_path: Optional[list[Union[str, int]]], expected: str) -> None:
+    # the hashes are part of the assets filenames, they must not change
+    assert append_hash_suffix("image", json_path) == expected
+
+
+@pytest.mark.parametrize(
+    "fieldType,cell,expected",
+    [
+        (Value("int32"), 1, 1),
+        (Value("int32"), None, None),
+        (List(Value("int32")), [1, None, 3], [1, None, 3]),
+        (List(Value("int32"), length=2), [1, 2], [1, 2]),
+        (LargeList(Value("string")), ["a", "b"], ["a", "b"]),
+        ([Value("int32")], [], []),
+        ({"a": Value("int32"), "b": List(Value("string"))}, {"b": ["x"], "a": None}, {"b": ["x"], "a": None}),
+        (List({"a": List(Value("int32"))}), [{"a": [1, 2]}, None, {"a": None}], [{"a": [1, 2]}, None, {"a": None}]),
+    ],
+)
+def test_transform_cell_nested(
+    storage_client_with_url_preparator: StorageClient, fieldType: Any, cell: Any, expected: Any
+) -> None:
+    value = transform_cell(
+        dataset="dataset",
+        revision=DEFAULT_REVISION,
+        config=DEFAULT_CONFIG,
+        split=DEFAULT_SPLIT,
+        row_idx=DEFAULT_ROW_IDX,
+        cell=cell,
+        featureName=DEFAULT_COLUMN_NAME,
+        plan=compile_cell_plan(fieldType),
+        storage_client=storage_client_with_url_preparator,
+    )
+    assert value == expected
+
+
+@pytest.mark.parametrize(
+    "fieldType,cell",
+    [
+        (List(Value("int32")), 1),
+        (List(Value("int32"), length=2), [1, 2, 3]),
+        ({"a": Value("int32")}, [1]),
+        ([Value("int32"), Value("int32")], [1, 2]),
+        ({"a": List(Value("int32"))}, {"a": "not a list"}),
+    ],
+)
+def test_transform_cell_invalid(storage_client_with_url_preparator: StorageClient, fieldType: Any, cell: Any) -> None:
+    with pytest.raises(TypeError):
+        transform_cell(
+            dataset="dataset",
+            revision=DEFAULT_REVISION,
+            config=DEFAULT_CONFIG,
+            split=DEFAULT_SPLIT,
+            row_idx=DEFAULT_ROW_IDX,
+            cell=cell,
+            featureName=DEFAULT_COLUMN_NAME,
+            plan=compile_cell_plan(fieldType),
+            storage_client=storage_client_with_url_preparator,
+        )
+
+
+@pytest.mark.parametrize(
+    "fieldType,expected_kind",
+    [
+        (List(Value("int32")), CellKind.COPY_LIST),
+        (LargeList(Value("string")), CellKind.COPY_LIST),
+        ([Value("int32")], CellKind.COPY_LIST),
+        ({"a": Value("int32"), "b": Value("string")}, CellKind.COPY_DICT),
+        (List(List(Value("int32"))), CellKind.LIST),
+        ({"a": Value("int32"), "b": List(Value("string"))}, CellKind.DICT),
+        (List(Image()), CellKind.LIST),
+    ],
+)
+def test_compile_cell_plan_copy(fieldType: Any, expected_kind: CellKind) -> None:
+    assert compile_cell_plan(fieldType).kind is expected_kind
+
+
+@pytest.mark.parametrize(
+    "fieldType,cell",
+    [(List(Value("int32")), list(range(10_000))), ({"a": Value("int32"), "b": Value("string")}, {"b": "x", "a": 1})],
+)
+def test_transform_cell_copy(storage_client_with_url_preparator: StorageClient, fieldType: Any, cell: Any) -> None:
+    value = transform_cell(
+        dataset="dataset",
+        revision=DEFAULT_REVISION,
+        config=DEFAULT_CONFIG,
+        split=DEFAULT_SPLIT,
+        row_idx=DEFAULT_ROW_IDX,
+        cell=cell,
+        featureName=DEFAULT_COLUMN_NAME,
+        plan=compile_cell_plan(fieldType),
+        storage_client=storage_client_with_url_preparator,
+    )
+    # a copy of the cell is returned
+    assert value == cell
+    assert value is not cell
+
+
+def test_transform_cell_unknown_key(storage_client_with_url_preparator: StorageClient) -> None:
+    with pytest.raises(KeyError):
+        transform_cell(
+            dataset="dataset",
+            revision=DEFAULT_REVISION,
+            config=DEFAULT_CONFIG,
+            split=DEFAULT_SPLIT,
+            row_idx=DEFAULT_ROW_IDX,
+            cell={"a": 1, "b": 2},
+            featureName=DEFAULT_COLUMN_NAME,
+            plan=compile_cell_plan({"a": Value("int32")}),
+            storage_client=storage_client_with_url_preparator,
+        )
+
+
+def test_transform_cell_nested_json_paths(storage_client_with_url_preparator: StorageClient) -> None:
+    fieldType = {"a": Value("int32"), "b": List({"c": List(Value("int32")), "images": List(Image())}), "d": Image()}
+    image_cell = PILImage.new("RGB", (4, 4))
+    cell = {
+        "a": 1,
+        "b": [{"c": [1], "images": [image_cell, None, image_cell]}, None, {"c": None, "images": [image_cell]}],
+        "d": image_cell,
+    }
+    value = transform_cell(
+        dataset="dataset",
+        revision=DEFAULT_REVISION,
+        config=DEFAULT_CONFIG,
+        split=DEFAULT_SPLIT,
+        row_idx=DEFAULT_ROW_IDX,
+        cell=cell,
+        featureName=DEFAULT_COLUMN_NAME,
+        plan=compile_cell_plan(fieldType),
+        storage_client=storage_client_with_url_preparator,
+    )
+    # each image is stored with the hash of its own json path
+    json_paths_and_image_values: list[tuple[list[Union[str, int]], Any]] = [
+        (["b", 0, "images", 0], value["b"][0]["images"][0]),
+        (["b", 0, "images", 2], value["b"][0]["images"][2]),
+        (["b", 2, "images", 0], value["b"][2]["images"][0]),
+        (["d"], value["d"]),
+    ]
+    for json_path, image_value in json_paths_and_image_values:
+        assert image_value["src"].endswith(f"/{append_hash_suffix('image', json_path)}.jpg")
+    assert value["b"][0]["images"][1] is None
+    assert value["b"][0]["c"] == [1]
+    assert value["b"][1] is None
+
+
+@pytest.mark.parametrize("amplitude", [0.5, 1.5])
+def test_to_pcm_16(amplitude: float) -> None:
+    rng = np.random.default_rng(0)
+    array = ((rng.random(16_000) - 0.5) * 2 * amplitude).astype(np.float32)
+    # same result as letting libsndfile convert the float samples
+    expected_buffer, buffer = BytesIO(), BytesIO()
+    soundfile.write(expected_buffer, array, 16_000, format="wav")
+    soundfile.write(buffer, to_pcm_16(array), 16_000, format="wav", subtype="PCM_16")
+    assert buffer.getvalue() == expected_buffer.getvalue()
+
+
+@pytest.mark.filterwarnings("error")
+def test_to_pcm_16_non_finite() -> None:
+    array = np.array([np.nan, np.inf, -np.inf, 0.5, -1.0, 2.0], dtype=np.float32)
+    # same result as letting libsndfile convert the float samples, without "invalid value" warnings
+    expected_buffer, buffer = BytesIO(), BytesIO()
+    soundfile.write(expected_buffer, array, 16_000, format="wav")
+    soundfile.write(buffer, to_pcm_16(array), 16_000, format="wav", subtype="PCM_16")
+    assert buffer.getvalue() == expected_buffer.getvalue()
+    assert to_pcm_16(array).tolist() == [-32768, 32767, -32768, 16384, -32768, 32767]
+
+
+@pytest.mark.parametrize(
+    "mode,expected_extension",
+    [("RGB", ".jpg"), ("L", ".jpg"), ("1", ".jpg"), ("CMYK", ".jpg"), ("RGBA", ".png"), ("P", ".png"), ("LA", ".png")],
+)
+def test_image_format(storage_client_with_url_preparator: StorageClient, mode: str, expected_extension: str) -> None:
+    value = image(
+        dataset="dataset",
+        revision=DEFAULT_REVISION,
+        config=DEFAULT_CONFIG,
+        split=DEFAULT_SPLIT,
+        row_idx=DEFAULT_ROW_IDX,
+        value=PILImage.new(mode, (4, 4)),
+        featureName=DEFAULT_COLUMN_NAME,
+        storage_client=storage_client_with_url_preparator,
+    )
+    assert value["src"].endswith(f"/image{expected_extension}")
+
+
+@pytest.mark.parametrize(
+    "format,expected_formats",
+    [
+        ("JPEG", ("JPEG",)),
+        ("PNG", ("PNG",)),
+        ("GIF", ("GIF",)),
+        ("TIFF", ("TIFF",)),
+        ("BMP", ("BMP",)),
+        ("WEBP", None),
+        ("PPM", None),
+    ],
+)
+def test_infer_image_formats(format: str, expected_formats: Optional[tuple[str, ...]]) -> None:
+    buffer = BytesIO()
+    PILImage.new("RGB", (4, 4)).save(buffer, format=format)
+    image_bytes = buffer.getvalue()
+    assert infer_image_formats(image_bytes) == expected_formats
+    # the image is opened with the same format as when all the formats are tried
+    assert PILImage.open(BytesIO(image_bytes), formats=expected_formats).format == format
+    assert infer_image_formats(b"") is None
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "audio.wav",
+        "/data/audio.mp3",
+        "zip://audio.wav::https://foo.bar/data.zip",
+        "zip://folder/audio::https://foo.bar/data.zip",
+        "hf://datasets/user/dataset@main/video.tar.mp4",
+        "https://foo.bar/data.v2/audio",
+        "https://foo.bar/data/.hidden",
+        "https://foo.bar/data/..hidden.wav",
+        "https://foo.bar/data/audio.",
+        "audio",
+        "",
+    ],
+)
+def test_get_path_extension(path: str) -> None:
+    assert get_path_extension(path) == os.path.splitext(path.split("::")[0])[1]